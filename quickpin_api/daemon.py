@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Local submission daemon for the QuickPin API.
+
+Accepts profile submissions from local producers over a Unix socket or
+localhost HTTP and coalesces them into large chunks per (site, stub),
+sharing one rate budget and connection pool. Each producer is
+acknowledged once all of its profiles have been submitted.
+
+Includes a thin client for producers.
+"""
+
+import http.client
+import ipaddress
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from quickpin_api.qpi import (SITES, QPIError, RateLimiter, SubmissionResult,
+                              build_profiles)
+
+
+def _validate_profiles(profiles):
+    """
+    Raise ValueError unless `profiles` is a list of profile dicts.
+
+    Profiles from different producers share a request, so each must be
+    well formed on its own: a known `site`, exactly one non-empty
+    `username` or `upstream_id` and a list of string `labels`.
+    """
+    if not isinstance(profiles, list):
+        raise ValueError('`profiles` must be a list.')
+
+    for profile in profiles:
+        if not isinstance(profile, dict):
+            raise ValueError('Each profile must be an object.')
+
+        if profile.get('site') not in SITES:
+            raise ValueError('Profile `site` must be one of {}.'
+                             .format(', '.join(SITES)))
+
+        keys = [key for key in ('username', 'upstream_id') if key in profile]
+
+        if len(keys) != 1:
+            raise ValueError('Profile needs exactly one of `username` or '
+                             '`upstream_id`.')
+
+        value = profile[keys[0]]
+
+        if not isinstance(value, str) or value.strip() == '':
+            raise ValueError('Profile `{}` must be a non-empty string.'
+                             .format(keys[0]))
+
+        labels = profile.get('labels')
+
+        if (not isinstance(labels, list) or
+                not all(isinstance(label, str) for label in labels)):
+            raise ValueError('Profile `labels` must be a list of strings.')
+
+
+class _Ticket(object):
+    """
+    Tracks the profiles of one producer submission until all are sent.
+    """
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.accepted = 0
+        self.failed = 0
+        self.ids = []
+        self.errors = []
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+
+        if total == 0:
+            self.event.set()
+
+    def record(self, result, id_=None):
+        """
+        Record the result of the chunk carrying one of our profiles.
+        """
+        with self.lock:
+            self.done += 1
+
+            if result.ok:
+                self.accepted += 1
+                if id_ is not None:
+                    self.ids.append(id_)
+            else:
+                self.failed += 1
+                if result.error not in self.errors:
+                    self.errors.append(result.error)
+
+            if self.done == self.total:
+                self.event.set()
+
+    def to_dict(self):
+        return {
+            'accepted': self.accepted,
+            'failed': self.failed,
+            'ids': self.ids,
+            'errors': self.errors,
+        }
+
+
+class SubmissionBatcher(object):
+    """
+    Coalesce profile submissions into chunked QuickPin API requests.
+
+    Profiles are queued per (site, stub). A queue is flushed once it holds
+    `chunk_size` profiles or its oldest profile has waited `window`
+    seconds. Ready queues are served round-robin, so a large backlog for
+    one (site, stub) does not hold up the others. All workers share one
+    rate limiter and the QPI session.
+    """
+    def __init__(self, qpi, chunk_size=100, window=1.0, interval=5,
+                 concurrency=1):
+        if chunk_size < 1:
+            raise ValueError('chunk size must be at least 1')
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self.qpi = qpi
+        self.chunk_size = chunk_size
+        self.window = window
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(interval)
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.opened = {}
+        self.workers = []
+        self.stopping = False
+
+    def start(self):
+        for _ in range(self.concurrency):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """
+        Flush queued profiles and wait for the workers to finish.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, profiles, stub=False, timeout=None):
+        """
+        Queue profiles and block until they have all been submitted.
+
+        Returns an acknowledgement dict, or None if `timeout` expired.
+        Raises ValueError for malformed profiles, before any are queued.
+        """
+        _validate_profiles(profiles)
+        ticket = _Ticket(len(profiles))
+
+        with self.condition:
+            if self.stopping:
+                raise QPIError('Daemon is shutting down.')
+
+            for profile in profiles:
+                key = (profile['site'], stub)
+
+                if key not in self.pending:
+                    self.pending[key] = []
+                    self.opened[key] = time.time()
+
+                self.pending[key].append((profile, ticket))
+
+            self.condition.notify_all()
+
+        if not ticket.event.wait(timeout):
+            return None
+
+        return ticket.to_dict()
+
+    def _next_batch(self):
+        """
+        Wait for a queue to become ready and pop one chunk from it.
+        """
+        with self.condition:
+            while True:
+                if self.stopping and not self.pending:
+                    return None
+
+                now = time.time()
+                timeout = None
+
+                for key, entries in self.pending.items():
+                    deadline = self.opened[key] + self.window
+
+                    if (len(entries) >= self.chunk_size or
+                            deadline <= now or self.stopping):
+                        batch = entries[:self.chunk_size]
+                        rest = entries[self.chunk_size:]
+
+                        # Re-inserting moves the key to the back of the
+                        # queue order, behind other ready keys.
+                        del self.pending[key]
+
+                        if rest:
+                            self.pending[key] = rest
+                        else:
+                            del self.opened[key]
+
+                        return key[1], batch
+
+                    if timeout is None or deadline - now < timeout:
+                        timeout = deadline - now
+
+                self.condition.wait(timeout)
+
+    def _work(self):
+        while True:
+            next_batch = self._next_batch()
+
+            if next_batch is None:
+                return
+
+            stub, batch = next_batch
+            self._dispatch(stub, batch)
+
+    def _dispatch(self, stub, batch):
+        profiles = [profile for profile, _ in batch]
+
+        try:
+            result = self.qpi.submit_chunk(profiles,
+                                           stub=stub,
+                                           rate_limiter=self.rate_limiter)
+        except Exception as e:
+            # Fail the batch rather than the worker, so producers are still
+            # acknowledged and later batches are still sent.
+            result = SubmissionResult(start=0,
+                                      end=len(profiles),
+                                      status=None,
+                                      latency=0.0,
+                                      error='{}: {}'.format(type(e).__name__,
+                                                            e))
+
+        # IDs can only be attributed when the server returns one per profile.
+        if len(result.ids) == len(profiles):
+            ids = result.ids
+        else:
+            ids = [None] * len(profiles)
+
+        for (_, ticket), id_ in zip(batch, ids):
+            ticket.record(result, id_)
+
+
+class _SubmissionHandler(BaseHTTPRequestHandler):
+    """
+    Accept `POST /submit` with a JSON body `{"profiles": [...], "stub": bool}`.
+    """
+    def do_POST(self):
+        if self.path.rstrip('/') != '/submit':
+            self._send_json(404, {'message': 'Not found.'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf8'))
+            profiles = body['profiles']
+            stub = body.get('stub', False)
+
+            if not isinstance(stub, bool):
+                raise ValueError('`stub` must be a boolean.')
+
+            ack = self.server.batcher.submit(profiles, stub=stub)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'message': 'Invalid submission: {}'
+                                             .format(e)})
+            return
+        except QPIError as e:
+            self._send_json(503, {'message': e.message})
+            return
+
+        self._send_json(200, ack)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address.
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def is_loopback(host):
+    """
+    Return True if `host` is localhost or a loopback address.
+    """
+    if host == 'localhost':
+        return True
+
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _remove_stale_socket(socket_path):
+    """
+    Remove a socket left by a previous run, refusing to take over a live one.
+    """
+    if not (os.path.exists(socket_path) and
+            stat.S_ISSOCK(os.stat(socket_path).st_mode)):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+
+    raise QPIError('A daemon is already listening on {}'.format(socket_path))
+
+
+def make_server(batcher, host='127.0.0.1', port=8070, socket_path=None):
+    """
+    Create a daemon server on `socket_path` or, if not given, `host:port`.
+
+    The daemon has no authentication, so `host` must be a loopback address.
+    """
+    if socket_path is not None:
+        _remove_stale_socket(socket_path)
+        server = _UnixHTTPServer(socket_path, _SubmissionHandler)
+    else:
+        if not is_loopback(host):
+            raise QPIError('Refusing to listen on non-loopback host {}'
+                           .format(host))
+        server = _HTTPServer((host, port), _SubmissionHandler)
+
+    server.batcher = batcher
+    return server
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(qpi, host='127.0.0.1', port=8070, socket_path=None,
+          chunk_size=100, window=1.0, interval=5, concurrency=1,
+          started=None):
+    """
+    Run the submission daemon until interrupted.
+
+    `started` is called with a status message once the daemon is listening.
+    """
+    batcher = SubmissionBatcher(qpi,
+                                chunk_size=chunk_size,
+                                window=window,
+                                interval=interval,
+                                concurrency=concurrency)
+    server = make_server(batcher,
+                         host=host,
+                         port=port,
+                         socket_path=socket_path)
+    batcher.start()
+
+    if started is not None:
+        if socket_path is not None:
+            started('Listening on {}'.format(socket_path))
+        else:
+            started('Listening on http://{}:{}/submit'.format(host, port))
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _terminate)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient(object):
+    """
+    Thin client for submitting profiles through a local daemon.
+
+    Example:
+        client = DaemonClient(socket_path='/tmp/quickpin.sock')
+        client.submit_usernames(['hyperiongray'], 'twitter')
+    """
+    def __init__(self, host='127.0.0.1', port=8070, socket_path=None,
+                 timeout=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.socket_path is not None:
+            return _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port,
+                                          timeout=self.timeout)
+
+    def submit_profiles(self, profiles, stub=False):
+        """
+        Submit profiles and block until the daemon acknowledges them.
+
+        Returns a dict with `accepted` and `failed` counts, server assigned
+        `ids` and any `errors`.
+        """
+        body = json.dumps({'profiles': profiles, 'stub': stub})
+        connection = self._connection()
+
+        try:
+            connection.request('POST', '/submit', body=body,
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = json.loads(response.read().decode('utf8'))
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise QPIError(data.get('message', 'Daemon error.'))
+
+        return data
+
+    def submit_usernames(self, usernames, site, stub=False, labels={}):
+        """
+        Submit list of usernames through the daemon.
+        """
+        profiles = build_profiles('username', usernames, site, labels)
+        return self.submit_profiles(profiles, stub=stub)
+
+    def submit_user_ids(self, user_ids, site, stub=False, labels={}):
+        """
+        Submit list of user IDs through the daemon.
+        """
+        profiles = build_profiles('upstream_id', user_ids, site, labels)
+        return self.submit_profiles(profiles, stub=stub)
@@ -9,7 +9,9 @@ import requests
 import click
 import csv
 import json
+import queue
 import sys
+import threading
 import time
 import urllib
 from getpass import getpass
@@ -17,6 +19,9 @@ from pprint import pprint
 from sseclient import SSEClient
 
 
+SITES = ['twitter', 'instagram']
+
+
 class QPIError(Exception):
     """
     Represents a human-facing exception.
@@ -25,6 +30,157 @@ class QPIError(Exception):
         self.message = message
 
 
+class RateLimiter(object):
+    """
+    Enforce a minimum interval in seconds between API requests.
+
+    Safe to share between threads, so several workers can draw from one
+    rate budget.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        """
+        Block until the next request may be sent.
+        """
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SiteLimits(object):
+    """
+    Chunk size, request interval and concurrency for one site's queue.
+    """
+    def __init__(self, chunk_size=1, interval=5, concurrency=1):
+        if chunk_size < 1:
+            raise ValueError('chunk size must be at least 1')
+        if interval < 0:
+            raise ValueError('interval must not be negative')
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.concurrency = concurrency
+
+
+def build_profiles(field, values, site, labels={}):
+    """
+    Build profile dicts for `submit_profiles`.
+
+    Args:
+        field (str): profile key for the values, `username` or `upstream_id`.
+        values (list): usernames or user IDs.
+        site (str): social site of the profiles.
+
+    Keyword args:
+        labels (dict): profile labels keyed by value.
+    """
+    profiles = []
+
+    for value in values:
+        profile = {
+            field: value,
+            'site': site,
+            'labels': labels.get(value, [])
+        }
+        profiles.append(profile)
+
+    return profiles
+
+
+def _common_site(profiles):
+    """
+    Return the site shared by all profiles, or None if they differ.
+    """
+    sites = {profile.get('site') for profile in profiles}
+    return sites.pop() if len(sites) == 1 else None
+
+
+class SubmissionResult(object):
+    """
+    Outcome of submitting one chunk of profiles to QuickPin.
+
+    `start` and `end` delimit the chunk within the submitted profile list
+    (end is exclusive), `latency` is the request duration in seconds and
+    `ids` holds any IDs assigned by the server. `site` is set when all
+    profiles in the chunk belong to one site. `indexes` lists the input
+    positions of the chunk's profiles when they are not contiguous, and
+    `rows` their zero-based row numbers in the input file, when known.
+    """
+    fields = ['site', 'start', 'end', 'indexes', 'rows', 'status', 'latency',
+              'ids', 'message', 'error']
+
+    def __init__(self, start, end, status, latency,
+                 ids=None, message=None, error=None, site=None,
+                 indexes=None, rows=None):
+        self.site = site
+        self.start = start
+        self.end = end
+        self.indexes = indexes
+        self.rows = rows
+        self.status = status
+        self.latency = latency
+        self.ids = ids or []
+        self.message = message
+        self.error = error
+
+    def __len__(self):
+        if self.indexes is not None:
+            return len(self.indexes)
+        return self.end - self.start
+
+    def __repr__(self):
+        return '<SubmissionResult {}-{} status={}>'.format(self.start,
+                                                           self.end,
+                                                           self.status)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @classmethod
+    def from_response(cls, start, end, response, latency, ok=True,
+                      site=None):
+        """
+        Build a result from a `requests` response.
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if not isinstance(data, dict):
+            data = {}
+
+        ids = data.get('ids', data.get('id', []))
+        if not isinstance(ids, list):
+            ids = [ids]
+
+        message = data.get('message')
+        error = None if ok else (message or response.reason or 'HTTP error')
+
+        return cls(start=start,
+                   end=end,
+                   status=response.status_code,
+                   latency=latency,
+                   ids=ids,
+                   message=message,
+                   error=error,
+                   site=site)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+
 class QPI():
 
     def __init__(self,
@@ -32,7 +188,8 @@ class QPI():
                  token=None,
                  username=None,
                  password=None,
-                 disable_warnings=True):
+                 disable_warnings=True,
+                 timeout=None):
 
         self.app_url = app_url.rstrip('/')
         self.username = username
@@ -45,6 +202,8 @@ class QPI():
         self.headers = {}
         self.token = token
         self.allowed_response_codes = [200, 202]
+        self.session = requests.Session()
+        self.timeout = timeout
 
         if disable_warnings:
             requests.packages.urllib3.disable_warnings()
@@ -65,7 +224,8 @@ class QPI():
         authenticated status.
         """
         payload = {'email': username, 'password': password}
-        response = requests.post(self.auth_url, json=payload, verify=False)
+        response = self.session.post(self.auth_url, json=payload,
+                                     verify=False, timeout=self.timeout)
         response.raise_for_status()
         try:
             token = response.json()['token']
@@ -80,7 +240,8 @@ class QPI():
                         stub=False,
                         chunk_size=1,
                         interval=5,
-                        labels={}):
+                        labels={},
+                        raise_on_error=True):
         """
         Submit list of user IDs to add to QuickPin.
 
@@ -94,6 +255,8 @@ class QPI():
             chunk_size (int): chunk size used to batch API requests.
             interval (int): interval in seconds between API requests.
             labels (dict): profile labels.
+            raise_on_error (bool): raise on a rejected chunk instead of
+                yielding a failed result.
 
         Example:
             submit_user_ids(
@@ -102,25 +265,12 @@ class QPI():
                 labels={'32324234': ['male']}
             )
         """
-        profiles = []
-
-        for user_id in user_ids:
-            if user_id in labels:
-                profile_labels = labels[user_id]
-            else:
-                profile_labels = []
-
-            profile = {
-                'upstream_id': user_id,
-                'site': site,
-                'labels': profile_labels
-            }
-            profiles.append(profile)
-
+        profiles = build_profiles('upstream_id', user_ids, site, labels)
         response = self.submit_profiles(profiles=profiles,
                                         stub=stub,
                                         chunk_size=chunk_size,
-                                        interval=interval)
+                                        interval=interval,
+                                        raise_on_error=raise_on_error)
 
         return response
 
@@ -130,7 +280,8 @@ class QPI():
                          stub=False,
                          chunk_size=1,
                          interval=5,
-                         labels={}):
+                         labels={},
+                         raise_on_error=True):
         """
         Submit list of usernames to add to QuickPin.
 
@@ -144,6 +295,8 @@ class QPI():
             chunk_size (int): chunk size used to batch API requests.
             interval (int): interval in seconds between API requests.
             labels (dict): profile labels.
+            raise_on_error (bool): raise on a rejected chunk instead of
+                yielding a failed result.
 
         Example:
             submit_usernames(
@@ -152,31 +305,20 @@ class QPI():
                 labels={'hyperiongray': ['osint']}
             )
         """
-        profiles = []
-        for username in usernames:
-            if username in labels:
-                profile_labels = labels[username]
-            else:
-                profile_labels = []
-
-            profile = {
-                'username': username,
-                'site': site,
-                'labels': profile_labels
-            }
-            profiles.append(profile)
-
+        profiles = build_profiles('username', usernames, site, labels)
         responses = self.submit_profiles(profiles=profiles,
                                          stub=stub,
                                          chunk_size=chunk_size,
-                                         interval=interval)
+                                         interval=interval,
+                                         raise_on_error=raise_on_error)
         return responses
 
     def submit_profiles(self, profiles, stub=False,
-                        chunk_size=1, interval=5):
+                        chunk_size=1, interval=5, raise_on_error=True,
+                        rate_limiter=None):
         """
         Submit list of profiles to be added to QuickPin.
-        Yield responses.
+        Yield a SubmissionResult for each chunk.
 
         Args:
             profiles (list): list of profiles to be added.
@@ -189,6 +331,10 @@ class QPI():
             stub (bool): whether to import profiles as stubs.
             chunk_size (int): chunk size used to batch API requests.
             interval (int): interval in seconds between API requests.
+            raise_on_error (bool): raise on a rejected chunk or connection
+                error instead of yielding a failed result.
+            rate_limiter (RateLimiter): shared rate budget to draw from
+                instead of sleeping `interval` between requests.
 
         Examples:
             submit_profiles(
@@ -202,23 +348,164 @@ class QPI():
             raise QPIError("Please authenticate first.")
 
         for chunk_start in range(0, len(profiles), chunk_size):
-            chunk_end = chunk_start + chunk_size
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            elif chunk_start > 0:
+                time.sleep(interval)
+
+            chunk_end = min(chunk_start + chunk_size, len(profiles))
             chunk = profiles[chunk_start:chunk_end]
             payload = {
                 'profiles': chunk,
                 'stub': stub
             }
-            response = requests.post(self.profile_url,
-                                     headers=self.headers,
-                                     json=payload,
-                                     verify=False)
-
-            if response not in self.allowed_response_codes:
-                pprint(response.content)
+            started = time.time()
+
+            try:
+                response = self.session.post(self.profile_url,
+                                             headers=self.headers,
+                                             json=payload,
+                                             verify=False,
+                                             timeout=self.timeout)
+            except requests.RequestException as e:
+                if raise_on_error:
+                    raise
+
+                yield SubmissionResult(start=chunk_start,
+                                       end=chunk_end,
+                                       status=None,
+                                       latency=time.time() - started,
+                                       error=str(e),
+                                       site=_common_site(chunk))
+                continue
+
+            latency = time.time() - started
+            ok = response.status_code in self.allowed_response_codes
+
+            if not ok and raise_on_error:
                 response.raise_for_status()
+                raise QPIError('Unexpected response status {}'
+                               .format(response.status_code))
 
-            yield response.content
-            time.sleep(interval)
+            yield SubmissionResult.from_response(start=chunk_start,
+                                                 end=chunk_end,
+                                                 response=response,
+                                                 latency=latency,
+                                                 ok=ok,
+                                                 site=_common_site(chunk))
+
+    def submit_chunk(self, profiles, stub=False, rate_limiter=None):
+        """
+        Submit profiles in a single request and return a SubmissionResult.
+
+        Rejected chunks and connection errors are returned as failed results
+        rather than raised.
+        """
+        results = self.submit_profiles(profiles=profiles,
+                                       stub=stub,
+                                       chunk_size=len(profiles),
+                                       raise_on_error=False,
+                                       rate_limiter=rate_limiter)
+        return next(results)
+
+    def submit_mixed_profiles(self, profiles, stub=False, limits={},
+                              default_limits=None):
+        """
+        Submit profiles from several sites, draining each site in parallel.
+        Yield a SubmissionResult for each chunk as it completes.
+
+        Profiles are routed to a queue per site. Each queue has its own
+        chunk size, concurrency and rate budget, so a slow or throttled site
+        does not hold up the others. Result `indexes` are the positions of
+        the chunk's profiles in `profiles`, and `start` and `end` span them.
+        Failed chunks are yielded rather than raised; any other error in a
+        worker is raised here. Closing the generator early stops the
+        workers after their current chunk.
+
+        Args:
+            profiles (list): list of profiles to be added, see
+                `submit_profiles`.
+
+        Keyword args:
+            stub (bool): whether to import profiles as stubs.
+            limits (dict): SiteLimits keyed by site.
+            default_limits (SiteLimits): limits for sites not in `limits`.
+
+        Example:
+            submit_mixed_profiles(
+                [{'username': 'hyperiongray', 'site': 'twitter',
+                  'labels': []},
+                 {'username': 'darpa', 'site': 'instagram', 'labels': []}],
+                limits={'twitter': SiteLimits(chunk_size=50, interval=1)}
+            )
+        """
+        if not self.authenticated:
+            raise QPIError("Please authenticate first.")
+
+        if default_limits is None:
+            default_limits = SiteLimits()
+
+        by_site = {}
+        for index, profile in enumerate(profiles):
+            by_site.setdefault(profile['site'], []).append((index, profile))
+
+        results = queue.Queue()
+        stop = threading.Event()
+        workers = 0
+
+        for site, entries in by_site.items():
+            site_limits = limits.get(site, default_limits)
+            rate_limiter = RateLimiter(site_limits.interval)
+            chunks = queue.Queue()
+
+            for start in range(0, len(entries), site_limits.chunk_size):
+                chunks.put(entries[start:start + site_limits.chunk_size])
+
+            for _ in range(site_limits.concurrency):
+                worker = threading.Thread(target=self._drain_site,
+                                          args=(chunks, stub, rate_limiter,
+                                                results, stop),
+                                          daemon=True)
+                worker.start()
+                workers += 1
+
+        try:
+            while workers > 0:
+                result = results.get()
+
+                if result is None:
+                    workers -= 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    yield result
+        finally:
+            stop.set()
+
+    def _drain_site(self, chunks, stub, rate_limiter, results, stop):
+        """
+        Submit chunks from one site's queue until it is empty or `stop` is
+        set. Always ends with a None sentinel on `results`.
+        """
+        try:
+            while not stop.is_set():
+                try:
+                    entries = chunks.get_nowait()
+                except queue.Empty:
+                    return
+
+                indexes = [index for index, _ in entries]
+                result = self.submit_chunk([profile for _, profile in entries],
+                                           stub=stub,
+                                           rate_limiter=rate_limiter)
+                result.indexes = indexes
+                result.start = indexes[0]
+                result.end = indexes[-1] + 1
+                results.put(result)
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(None)
 
     def get(self, resource, page=1, rpp=100):
         """
@@ -236,8 +523,9 @@ class QPI():
         }
 
         url = urllib.parse.urljoin(self.api_url, resource)
-        response = requests.get(url, headers=self.headers,
-                                params=params, verify=False)
+        response = self.session.get(url, headers=self.headers,
+                                    params=params, verify=False,
+                                    timeout=self.timeout)
 
         response.raise_for_status()
 
@@ -254,8 +542,8 @@ class QPI():
             raise QPIError("Please authenticate first.")
 
         url = urllib.parse.urljoin(self.api_url, resource)
-        response = requests.delete(url, headers=self.headers,
-                                   verify=False)
+        response = self.session.delete(url, headers=self.headers,
+                                       verify=False, timeout=self.timeout)
 
         response.raise_for_status()
 
@@ -296,10 +584,11 @@ class QPI():
 
         param_str = "&".join("%s=%s" % (k, v) for k, v in params.items())
 
-        response = requests.get(self.search_url,
-                                headers=self.headers,
-                                params=param_str,
-                                verify=False)
+        response = self.session.get(self.search_url,
+                                    headers=self.headers,
+                                    params=param_str,
+                                    verify=False,
+                                    timeout=self.timeout)
 
         response.raise_for_status()
 
@@ -324,6 +613,164 @@ def _parse_labels(text):
     return labels
 
 
+def _parse_site_limits(ctx, param, value):
+    """
+    Parse `SITE:CHUNK:INTERVAL:CONCURRENCY` options into SiteLimits.
+    """
+    limits = {}
+
+    for option in value:
+        try:
+            site, chunk_size, interval, concurrency = option.split(':')
+            chunk_size = int(chunk_size)
+            interval = float(interval)
+            concurrency = int(concurrency)
+        except ValueError:
+            raise click.BadParameter(
+                '"{}" is not SITE:CHUNK:INTERVAL:CONCURRENCY'.format(option)
+            )
+
+        if site not in SITES:
+            raise click.BadParameter('unknown site "{}"'.format(site))
+
+        try:
+            limits[site] = SiteLimits(chunk_size=chunk_size,
+                                      interval=interval,
+                                      concurrency=concurrency)
+        except ValueError as e:
+            raise click.BadParameter('"{}": {}'.format(option, e))
+
+    return limits
+
+
+class _SubmissionReport(object):
+    """
+    Stream submission results to a report file and tally a summary.
+    """
+    def __init__(self, path=None, format_='ndjson', flush_every=10):
+        self.format = format_
+        self.flush_every = max(flush_every, 1)
+        self.file = None
+        self.writer = None
+        self.chunks = 0
+        self.profiles = 0
+        self.failed_chunks = 0
+        self.failed_profiles = 0
+        self.ids = 0
+        self.latency = 0.0
+        self.started = time.time()
+
+        if path is not None:
+            self.file = open(path, 'w', newline='')
+
+            if self.format == 'csv':
+                fields = SubmissionResult.fields
+                self.writer = csv.DictWriter(self.file, fieldnames=fields)
+                self.writer.writeheader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        """
+        Record a SubmissionResult.
+        """
+        self.chunks += 1
+        self.profiles += len(result)
+        self.ids += len(result.ids)
+        self.latency += result.latency
+
+        if not result.ok:
+            self.failed_chunks += 1
+            self.failed_profiles += len(result)
+
+        if self.file is None:
+            return
+
+        row = result.to_dict()
+
+        if self.writer is not None:
+            for field in ('ids', 'indexes', 'rows'):
+                if row[field] is not None:
+                    row[field] = '|'.join(str(value) for value in row[field])
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + '\n')
+
+        if self.chunks % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def summary(self):
+        """
+        Return a one line summary of the results recorded so far.
+        """
+        mean_latency = self.latency / self.chunks if self.chunks else 0.0
+
+        return ('Submitted {} profiles in {} chunks ({} failed chunks, '
+                '{} failed profiles), {} IDs assigned, mean latency {:.3f}s, '
+                'elapsed {:.1f}s.').format(self.profiles,
+                                           self.chunks,
+                                           self.failed_chunks,
+                                           self.failed_profiles,
+                                           self.ids,
+                                           mean_latency,
+                                           time.time() - self.started)
+
+
+def _with_rows(results, rows):
+    """
+    Set the input file rows of each result's profiles.
+
+    `rows[n]` is the row number of the n-th submitted profile.
+    """
+    for result in results:
+        if result.indexes is not None:
+            positions = result.indexes
+        else:
+            positions = range(result.start, result.end)
+
+        result.rows = [rows[position] for position in positions]
+        yield result
+
+
+def _report_results(results, total, label, report):
+    """
+    Consume results with a progress bar, streaming them to `report`.
+    """
+    with report, click.progressbar(length=total, label=label) as bar:
+        for result in results:
+            report.write(result)
+            bar.update(len(result))
+
+    click.echo(report.summary())
+
+
+def report_options(command):
+    """
+    Add report file options to a submission command.
+    """
+    command = click.option('--flush-every',
+                           default=10,
+                           type=click.INT,
+                           help='flush the report every N chunks')(command)
+    command = click.option('--report-format',
+                           default='ndjson',
+                           type=click.Choice(['ndjson', 'csv']),
+                           help='report file format')(command)
+    command = click.option('--report',
+                           type=click.Path(dir_okay=False, writable=True),
+                           help='file to stream per-chunk results to')(command)
+    return command
+
+
 class Config(object):
     """
     Base configuration class.
@@ -421,20 +868,22 @@ def cli(config, username, password, token, url):
               default=5,
               help='request interval in seconds')
 @click.argument('input', type=click.File('r'))
-@click.argument('site', type=click.Choice(['twitter', 'instagram']))
+@click.argument('site', type=click.Choice(SITES))
+@report_options
 @pass_config
-def submit_names(config, input, site, stub, chunk, interval):
+def submit_names(config, input, site, stub, chunk, interval,
+                 report, report_format, flush_every):
     """
     Submit profiles by username.
     """
 
     usernames = []
     labels = {}
-    results = []
+    rows = []
     qpi = QPI(app_url=config.app_url, token=config.token)
     reader = csv.reader(input, quotechar='"', delimiter=',')
 
-    for row in reader:
+    for row_number, row in enumerate(reader):
         try:
             username = row[0].strip()
         except IndexError:
@@ -449,28 +898,26 @@ def submit_names(config, input, site, stub, chunk, interval):
             profile_labels = []
 
         usernames.append(username)
+        rows.append(row_number)
         labels[username] = list(set(profile_labels))
-        click.echo('Labels: ')
 
     if len(usernames) == 0:
         click.echo('Empty file')
         sys.exit()
 
-    responses = qpi.submit_usernames(usernames=usernames,
-                                     site=site,
-                                     stub=stub,
-                                     chunk_size=chunk,
-                                     interval=interval,
-                                     labels=labels)
-    with click.progressbar(
-        length=len(usernames),
-        label='Submitting usernames to QuickPin'
-    ) as bar:
-        for response in responses:
-            bar.update(1)
-            results.append(response)
-
-    pprint(results)
+    results = qpi.submit_usernames(usernames=usernames,
+                                   site=site,
+                                   stub=stub,
+                                   chunk_size=chunk,
+                                   interval=interval,
+                                   labels=labels,
+                                   raise_on_error=False)
+    _report_results(_with_rows(results, rows),
+                    total=len(usernames),
+                    label='Submitting usernames to QuickPin',
+                    report=_SubmissionReport(report,
+                                             format_=report_format,
+                                             flush_every=flush_every))
 
 
 @cli.command()
@@ -486,20 +933,22 @@ def submit_names(config, input, site, stub, chunk, interval):
               default=5,
               help='request interval in seconds')
 @click.argument('input', type=click.File('r'))
-@click.argument('site', type=click.Choice(['twitter', 'instagram']))
+@click.argument('site', type=click.Choice(SITES))
+@report_options
 @pass_config
-def submit_ids(config, input, site, stub, chunk, interval):
+def submit_ids(config, input, site, stub, chunk, interval,
+               report, report_format, flush_every):
     """
     Submit profiles by ID.
     """
 
     user_ids = []
     labels = {}
-    results = []
+    rows = []
     qpi = QPI(app_url=config.app_url, token=config.token)
     reader = csv.reader(input, quotechar='"', delimiter=',')
 
-    for row in reader:
+    for row_number, row in enumerate(reader):
         try:
             user_id = row[0].strip()
         except IndexError:
@@ -514,27 +963,122 @@ def submit_ids(config, input, site, stub, chunk, interval):
             profile_labels = []
 
         user_ids.append(user_id)
+        rows.append(row_number)
         labels[user_id] = list(set(profile_labels))
 
     if len(user_ids) == 0:
         click.echo('Empty file')
         sys.exit()
 
-    responses = qpi.submit_user_ids(user_ids=user_ids,
-                                    site=site,
-                                    stub=stub,
-                                    chunk_size=chunk,
-                                    interval=interval,
-                                    labels=labels)
-    with click.progressbar(
-        length=len(user_ids),
-        label='Submitting user IDs to QuickPin'
-    ) as bar:
-        for response in responses:
-            bar.update(1)
-            results.append(response)
+    results = qpi.submit_user_ids(user_ids=user_ids,
+                                  site=site,
+                                  stub=stub,
+                                  chunk_size=chunk,
+                                  interval=interval,
+                                  labels=labels,
+                                  raise_on_error=False)
+    _report_results(_with_rows(results, rows),
+                    total=len(user_ids),
+                    label='Submitting user IDs to QuickPin',
+                    report=_SubmissionReport(report,
+                                             format_=report_format,
+                                             flush_every=flush_every))
+
+
+@cli.command()
+@click.option('--stub',
+              type=click.BOOL,
+              default=False,
+              help='import as stubs')
+@click.option('--by',
+              default='name',
+              type=click.Choice(['name', 'id']),
+              help='whether rows hold usernames or user IDs')
+@click.option('--chunk',
+              default=1,
+              type=click.IntRange(min=1),
+              help='number of profiles to submit with each request')
+@click.option('--interval',
+              default=5,
+              type=click.FloatRange(min=0),
+              help='request interval in seconds, per site')
+@click.option('--concurrency',
+              default=1,
+              type=click.IntRange(min=1),
+              help='number of concurrent requests, per site')
+@click.option('--site-limit',
+              'site_limits',
+              multiple=True,
+              callback=_parse_site_limits,
+              help='per-site override as SITE:CHUNK:INTERVAL:CONCURRENCY')
+@click.argument('input', type=click.File('r'))
+@report_options
+@pass_config
+def submit_mixed(config, input, by, stub, chunk, interval, concurrency,
+                 site_limits, report, report_format, flush_every):
+    """
+    Submit profiles from several sites.
+
+    Each row holds the site, the username (or user ID with --by=id) and
+    optional labels. Sites are submitted in parallel, each with its own
+    chunk size, concurrency and rate budget.
+    """
 
-    pprint(results)
+    profiles = []
+    rows = []
+    skipped = 0
+    field = 'username' if by == 'name' else 'upstream_id'
+    qpi = QPI(app_url=config.app_url, token=config.token)
+    reader = csv.reader(input, quotechar='"', delimiter=',')
+
+    for row_number, row in enumerate(reader):
+        try:
+            site = row[0].strip().lower()
+            value = row[1].strip()
+        except IndexError:
+            continue  # Empty line
+
+        if value == '':
+            continue
+
+        if site not in SITES:
+            skipped += 1
+            continue
+
+        try:
+            profile_labels = _parse_labels(row[2])
+        except IndexError:
+            profile_labels = []
+
+        profiles.append({
+            field: value,
+            'site': site,
+            'labels': list(set(profile_labels))
+        })
+        rows.append(row_number)
+
+    if skipped > 0:
+        click.echo('Skipped {} rows with unknown sites'.format(skipped),
+                   err=True)
+
+    if len(profiles) == 0:
+        click.echo('Empty file')
+        sys.exit()
+
+    results = qpi.submit_mixed_profiles(
+        profiles=profiles,
+        stub=stub,
+        limits=site_limits,
+        default_limits=SiteLimits(chunk_size=chunk,
+                                  interval=interval,
+                                  concurrency=concurrency)
+    )
+    _report_results(_with_rows(results, rows),
+                    total=len(profiles),
+                    label='Submitting profiles to QuickPin',
+                    report=_SubmissionReport(report,
+                                             format_=report_format,
+                                             flush_every=flush_every))
 
 
 @cli.command()
@@ -616,6 +1160,62 @@ def token(config):
     click.echo('e.g. export QUICKPIN_TOKEN="{}"'.format(config.token))
 
 
+@cli.command()
+@click.option('--socket',
+              'socket_path',
+              type=click.Path(dir_okay=False),
+              help='Unix socket to listen on instead of host and port')
+@click.option('--host',
+              default='127.0.0.1',
+              help='loopback host to listen on')
+@click.option('--port',
+              default=8070,
+              type=click.INT,
+              help='port to listen on')
+@click.option('--chunk',
+              default=100,
+              type=click.IntRange(min=1),
+              help='maximum number of profiles per request')
+@click.option('--window',
+              default=1.0,
+              type=click.FloatRange(min=0),
+              help='seconds to wait for a chunk to fill')
+@click.option('--interval',
+              default=5,
+              type=click.FloatRange(min=0),
+              help='minimum interval in seconds between requests')
+@click.option('--concurrency',
+              default=1,
+              type=click.IntRange(min=1),
+              help='number of concurrent requests')
+@click.option('--timeout',
+              default=60,
+              type=click.FLOAT,
+              help='API request timeout in seconds')
+@pass_config
+def serve(config, socket_path, host, port, chunk, window, interval,
+          concurrency, timeout):
+    """
+    Run a local daemon that batches submissions from many producers.
+    """
+    from quickpin_api.daemon import serve as serve_daemon
+
+    qpi = QPI(app_url=config.app_url, token=config.token, timeout=timeout)
+
+    try:
+        serve_daemon(qpi,
+                     host=host,
+                     port=port,
+                     socket_path=socket_path,
+                     chunk_size=chunk,
+                     window=window,
+                     interval=interval,
+                     concurrency=concurrency,
+                     started=click.echo)
+    except QPIError as e:
+        raise click.ClickException(e.message)
+
+
 @cli.command()
 @pass_config
 def notifications(config):
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Offline stand-ins for the QuickPin API.
+"""
+import json
+import threading
+import time
+
+import requests
+
+from quickpin_api.qpi import QPI
+
+
+class StubResponse(object):
+    """
+    Minimal `requests` response.
+    """
+    def __init__(self, status_code=202, data=None, reason='Accepted'):
+        self.status_code = status_code
+        self.reason = reason
+        self.content = b'' if data is None else json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content.decode())
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.reason, response=self)
+
+
+class StubSession(object):
+    """
+    Records profile submissions and answers them with `handler`.
+
+    `handler(profiles)` returns a StubResponse or raises. By default every
+    profile is accepted and assigned a sequential ID.
+    """
+    def __init__(self, handler=None, delays=None):
+        self.handler = handler or self.accept
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+        self.calls = []
+        self.timeouts = []
+        self.next_id = 0
+
+    def accept(self, profiles):
+        with self.lock:
+            ids = list(range(self.next_id, self.next_id + len(profiles)))
+            self.next_id += len(profiles)
+
+        return StubResponse(202, {'message': 'ok', 'ids': ids})
+
+    def post(self, url, headers=None, json=None, verify=True, timeout=None):
+        profiles = json['profiles']
+
+        with self.lock:
+            self.calls.append((time.time(), json['stub'], profiles))
+            self.timeouts.append(timeout)
+
+        delay = self.delays.get(profiles[0].get('site'), 0)
+        if delay:
+            time.sleep(delay)
+
+        return self.handler(profiles)
+
+
+def stub_qpi(session=None, timeout=None):
+    """
+    Return a QPI instance that talks to a StubSession.
+    """
+    qpi = QPI(app_url='http://quickpin.invalid', token='token',
+              timeout=timeout)
+    qpi.session = session or StubSession()
+    return qpi
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Submission daemon tests.
+"""
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from .stubs import StubResponse, StubSession, stub_qpi
+from quickpin_api.daemon import DaemonClient, SubmissionBatcher, make_server
+from quickpin_api.qpi import QPIError, build_profiles
+
+
+class BatcherTest(unittest.TestCase):
+    """
+    Test coalescing submissions into chunked requests.
+    """
+
+    def start_batcher(self, session, **kwargs):
+        kwargs.setdefault('interval', 0)
+        batcher = SubmissionBatcher(stub_qpi(session), **kwargs)
+        batcher.start()
+        self.addCleanup(batcher.stop)
+        return batcher
+
+    def submit_concurrently(self, batcher, submissions):
+        acks = [None] * len(submissions)
+
+        def producer(index, profiles, stub):
+            acks[index] = batcher.submit(profiles, stub=stub, timeout=5)
+
+        threads = [threading.Thread(target=producer, args=(i, p, s))
+                   for i, (p, s) in enumerate(submissions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return acks
+
+    def test_coalesce(self):
+        """
+        Test that small submissions are sent as one full chunk.
+        """
+        session = StubSession()
+        batcher = self.start_batcher(session, chunk_size=10, window=5)
+        submissions = [
+            (build_profiles('username', ['a{}'.format(i), 'b{}'.format(i)],
+                            'twitter'), False)
+            for i in range(5)
+        ]
+        started = time.time()
+        acks = self.submit_concurrently(batcher, submissions)
+
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(len(session.calls), 1)
+        self.assertEqual(len(session.calls[0][2]), 10)
+        self.assertEqual([ack['accepted'] for ack in acks], [2] * 5)
+        self.assertEqual(sorted(id_ for ack in acks for id_ in ack['ids']),
+                         list(range(10)))
+
+    def test_window_flush(self):
+        """
+        Test that a partial chunk is sent once the window expires.
+        """
+        session = StubSession()
+        batcher = self.start_batcher(session, chunk_size=100, window=0.2)
+        started = time.time()
+        ack = batcher.submit(build_profiles('username', ['a', 'b', 'c'],
+                                            'twitter'), timeout=5)
+
+        self.assertGreaterEqual(time.time() - started, 0.2)
+        self.assertEqual(ack, {'accepted': 3, 'failed': 0,
+                               'ids': [0, 1, 2], 'errors': []})
+        self.assertEqual(len(session.calls), 1)
+
+    def test_queues_per_site_and_stub(self):
+        """
+        Test that sites and stub flags are never mixed in one request.
+        """
+        session = StubSession()
+        batcher = self.start_batcher(session, chunk_size=100, window=0.1)
+        self.submit_concurrently(batcher, [
+            (build_profiles('username', ['a'], 'twitter'), False),
+            (build_profiles('username', ['b'], 'instagram'), False),
+            (build_profiles('username', ['c'], 'twitter'), True),
+            (build_profiles('username', ['d'], 'twitter'), False),
+        ])
+        requests = sorted((stub, sorted(p['username'] for p in profiles))
+                          for _, stub, profiles in session.calls)
+
+        self.assertEqual(requests, [(False, ['a', 'd']), (False, ['b']),
+                                    (True, ['c'])])
+
+    def test_rejected_chunk(self):
+        """
+        Test that a rejected chunk is acknowledged as failed.
+        """
+        session = StubSession(lambda profiles: StubResponse(
+            400, {'message': 'bad profile'}, reason='Bad Request'))
+        batcher = self.start_batcher(session, chunk_size=1, window=0)
+        ack = batcher.submit(build_profiles('username', ['a'], 'twitter'),
+                             timeout=5)
+
+        self.assertEqual(ack, {'accepted': 0, 'failed': 1, 'ids': [],
+                               'errors': ['bad profile']})
+
+    def test_worker_survives_exception(self):
+        """
+        Test that an unexpected error fails the batch but not the worker.
+        """
+        def handler(profiles):
+            if profiles[0]['username'] == 'boom':
+                raise RuntimeError('unexpected')
+            return StubResponse(202, {})
+
+        batcher = self.start_batcher(StubSession(handler), chunk_size=1,
+                                     window=0)
+        failed = batcher.submit(build_profiles('username', ['boom'],
+                                               'twitter'), timeout=5)
+        accepted = batcher.submit(build_profiles('username', ['ok'],
+                                                 'twitter'), timeout=5)
+
+        self.assertEqual(failed['failed'], 1)
+        self.assertEqual(failed['errors'], ['RuntimeError: unexpected'])
+        self.assertEqual(accepted['accepted'], 1)
+
+    def test_invalid_limits(self):
+        """
+        Test that limits which would never drain the queues are rejected.
+        """
+        for kwargs in ({'chunk_size': 0}, {'concurrency': 0}):
+            with self.assertRaises(ValueError):
+                SubmissionBatcher(stub_qpi(), **kwargs)
+
+    def test_round_robin(self):
+        """
+        Test that a backlog on one key does not hold up another key.
+        """
+        session = StubSession()
+        batcher = self.start_batcher(session, chunk_size=2, window=0.05,
+                                     interval=0.1)
+        backlog = threading.Thread(target=batcher.submit, args=(
+            build_profiles('username', ['u{}'.format(i) for i in range(20)],
+                           'twitter'),), kwargs={'timeout': 5})
+        backlog.start()
+        time.sleep(0.02)
+        started = time.time()
+        ack = batcher.submit(build_profiles('username', ['a'], 'instagram'),
+                             timeout=5)
+        elapsed = time.time() - started
+        backlog.join()
+        sites = [profiles[0]['site'] for _, _, profiles in session.calls]
+
+        self.assertEqual(ack['accepted'], 1)
+        self.assertLess(elapsed, 0.5)
+        self.assertLess(sites.index('instagram'), 5)
+
+    def test_request_timeout(self):
+        """
+        Test that API requests carry the QPI timeout.
+        """
+        session = StubSession()
+        batcher = SubmissionBatcher(stub_qpi(session, timeout=3),
+                                    chunk_size=1, window=0, interval=0)
+        batcher.start()
+        self.addCleanup(batcher.stop)
+        batcher.submit(build_profiles('username', ['a'], 'twitter'),
+                       timeout=5)
+
+        self.assertEqual(session.timeouts, [3])
+
+    def test_invalid_profiles(self):
+        """
+        Test that malformed submissions are rejected before queueing.
+        """
+        session = StubSession()
+        batcher = self.start_batcher(session, chunk_size=1, window=0)
+        invalid = [
+            ['site'],
+            {'site': 'twitter'},
+            [{'username': 'a', 'site': 'twitter'},
+             {'username': 'b', 'site': ['twitter']}],
+            [{'username': 'a', 'site': 'myspace', 'labels': []}],
+            [{'site': 'twitter', 'labels': []}],
+            [{'username': 'a', 'upstream_id': '1', 'site': 'twitter',
+              'labels': []}],
+            [{'username': '', 'site': 'twitter', 'labels': []}],
+            [{'upstream_id': 1, 'site': 'twitter', 'labels': []}],
+            [{'username': 'a', 'site': 'twitter'}],
+            [{'username': 'a', 'site': 'twitter', 'labels': 'osint'}],
+            [{'username': 'a', 'site': 'twitter', 'labels': [1]}],
+        ]
+
+        for profiles in invalid:
+            with self.assertRaises(ValueError):
+                batcher.submit(profiles, timeout=1)
+
+        self.assertEqual(batcher.pending, {})
+        self.assertEqual(session.calls, [])
+
+
+class ServerTest(unittest.TestCase):
+    """
+    Test the daemon server and client.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'quickpin.sock')
+        self.session = StubSession()
+        self.batcher = SubmissionBatcher(stub_qpi(self.session),
+                                         chunk_size=10, window=0.05,
+                                         interval=0)
+        self.batcher.start()
+
+    def tearDown(self):
+        self.batcher.stop()
+        shutil.rmtree(self.directory)
+
+    def start_server(self, **kwargs):
+        server = make_server(self.batcher, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_unix_socket(self):
+        """
+        Test submitting through a Unix socket.
+        """
+        self.start_server(socket_path=self.socket_path)
+        client = DaemonClient(socket_path=self.socket_path, timeout=5)
+        ack = client.submit_usernames(['a', 'b'], 'twitter')
+
+        self.assertEqual(ack['accepted'], 2)
+
+    def test_http(self):
+        """
+        Test submitting over localhost HTTP.
+        """
+        server = self.start_server(host='127.0.0.1', port=0)
+        client = DaemonClient(port=server.server_address[1], timeout=5)
+        ack = client.submit_user_ids(['1'], 'instagram')
+
+        self.assertEqual(ack['accepted'], 1)
+        self.assertEqual(self.session.calls[0][2][0]['upstream_id'], '1')
+
+    def test_invalid_submission(self):
+        """
+        Test that malformed submissions get a 400 response.
+        """
+        server = self.start_server(host='127.0.0.1', port=0)
+        client = DaemonClient(port=server.server_address[1], timeout=5)
+
+        for profiles in (['site'], {'site': 'twitter'},
+                         [{'site': ['twitter']}]):
+            with self.assertRaises(QPIError) as context:
+                client.submit_profiles(profiles)
+            self.assertIn('Invalid submission', context.exception.message)
+
+        with self.assertRaises(QPIError) as context:
+            client.submit_profiles(build_profiles('username', ['a'],
+                                                  'twitter'),
+                                   stub='false')
+        self.assertIn('`stub`', context.exception.message)
+        self.assertEqual(self.session.calls, [])
+
+    def test_non_loopback_host(self):
+        """
+        Test that the daemon refuses to listen beyond localhost.
+        """
+        with self.assertRaises(QPIError):
+            make_server(self.batcher, host='0.0.0.0', port=0)
+
+    def test_live_socket(self):
+        """
+        Test that a socket with a live listener is not taken over.
+        """
+        self.start_server(socket_path=self.socket_path)
+
+        with self.assertRaises(QPIError):
+            make_server(self.batcher, socket_path=self.socket_path)
+
+    def test_stale_socket(self):
+        """
+        Test that a socket left by a previous run is replaced.
+        """
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        self.start_server(socket_path=self.socket_path)
+        client = DaemonClient(socket_path=self.socket_path, timeout=5)
+
+        self.assertEqual(client.submit_usernames(['a'], 'twitter')['accepted'],
+                         1)
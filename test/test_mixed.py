@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Mixed-site submission tests.
+"""
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+import json
+import unittest
+from unittest import mock
+
+import click
+import requests
+from click.testing import CliRunner
+
+from .stubs import StubResponse, StubSession, stub_qpi
+from quickpin_api.qpi import (Config, SiteLimits, _parse_site_limits,
+                              _SubmissionReport, submit_mixed)
+
+
+def _mixed_profiles(sites):
+    return [{'username': 'user{}'.format(i), 'site': site, 'labels': []}
+            for i, site in enumerate(sites)]
+
+
+class MixedSubmissionTest(unittest.TestCase):
+    """
+    Test routing profiles to per-site queues.
+    """
+
+    def test_routing(self):
+        """
+        Test that each request holds one site and results map to input rows.
+        """
+        session = StubSession()
+        profiles = _mixed_profiles(['twitter', 'instagram'] * 5 +
+                                   ['twitter'] * 3)
+        limits = {
+            'twitter': SiteLimits(chunk_size=3, interval=0),
+            'instagram': SiteLimits(chunk_size=2, interval=0),
+        }
+        results = list(stub_qpi(session).submit_mixed_profiles(
+            profiles, limits=limits))
+
+        self.assertEqual(sorted(i for r in results for i in r.indexes),
+                         list(range(len(profiles))))
+
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertEqual({profiles[i]['site'] for i in result.indexes},
+                             {result.site})
+            self.assertEqual(result.start, result.indexes[0])
+            self.assertEqual(result.end, result.indexes[-1] + 1)
+
+        sizes = sorted((r.site, len(r)) for r in results)
+        self.assertEqual(sizes, [('instagram', 1), ('instagram', 2),
+                                 ('instagram', 2), ('twitter', 2),
+                                 ('twitter', 3), ('twitter', 3)])
+
+        for _, _, request in session.calls:
+            self.assertEqual(len({p['site'] for p in request}), 1)
+
+    def test_throttled_site(self):
+        """
+        Test that a slow site does not hold up the others.
+        """
+        session = StubSession(delays={'instagram': 0.5})
+        profiles = _mixed_profiles(['instagram'] * 2 + ['twitter'] * 6)
+        limits = {'instagram': SiteLimits(chunk_size=1, interval=0)}
+        default_limits = SiteLimits(chunk_size=2, interval=0)
+        results = stub_qpi(session).submit_mixed_profiles(
+            profiles, limits=limits, default_limits=default_limits)
+        sites = [result.site for result in results]
+
+        self.assertEqual(sites, ['twitter'] * 3 + ['instagram'] * 2)
+
+    def test_rate_budget(self):
+        """
+        Test that each site's requests respect its own interval.
+        """
+        session = StubSession()
+        profiles = _mixed_profiles(['twitter'] * 3 + ['instagram'] * 3)
+        limits = {
+            'twitter': SiteLimits(chunk_size=1, interval=0.2),
+            'instagram': SiteLimits(chunk_size=1, interval=0),
+        }
+        started = time.time()
+        list(stub_qpi(session).submit_mixed_profiles(profiles,
+                                                     limits=limits))
+        twitter = [t for t, _, request in session.calls
+                   if request[0]['site'] == 'twitter']
+        instagram = [t for t, _, request in session.calls
+                     if request[0]['site'] == 'instagram']
+
+        self.assertGreaterEqual(twitter[2] - twitter[0], 0.35)
+        self.assertLess(instagram[2] - started, 0.15)
+
+    def test_concurrency(self):
+        """
+        Test that a site's chunks are drained by several workers.
+        """
+        session = StubSession(delays={'instagram': 0.3})
+        profiles = _mixed_profiles(['instagram'] * 3)
+        limits = {'instagram': SiteLimits(chunk_size=1, interval=0,
+                                          concurrency=3)}
+        started = time.time()
+        results = list(stub_qpi(session).submit_mixed_profiles(
+            profiles, limits=limits))
+
+        self.assertEqual(len(results), 3)
+        self.assertLess(time.time() - started, 0.6)
+
+    def test_connection_error(self):
+        """
+        Test that connection errors are yielded as failed results.
+        """
+        def handler(profiles):
+            if profiles[0]['site'] == 'instagram':
+                raise requests.ConnectionError('refused')
+            return StubResponse(202, {})
+
+        profiles = _mixed_profiles(['twitter', 'instagram'])
+        results = list(stub_qpi(StubSession(handler)).submit_mixed_profiles(
+            profiles, default_limits=SiteLimits(interval=0)))
+        failed = [r for r in results if not r.ok]
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual([(r.site, r.indexes) for r in failed],
+                         [('instagram', [1])])
+
+    def test_worker_error_raised(self):
+        """
+        Test that an unexpected worker error is raised, not hung on.
+        """
+        def handler(profiles):
+            raise RuntimeError('unexpected')
+
+        profiles = _mixed_profiles(['twitter', 'instagram'])
+        qpi = stub_qpi(StubSession(handler))
+        raised = []
+
+        def consume():
+            try:
+                list(qpi.submit_mixed_profiles(
+                    profiles, default_limits=SiteLimits(interval=0)))
+            except RuntimeError as e:
+                raised.append(e)
+
+        thread = threading.Thread(target=consume, daemon=True)
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(raised), 1)
+
+    def test_stop_early(self):
+        """
+        Test that closing the generator stops the workers.
+        """
+        session = StubSession(delays={'twitter': 0.1})
+        profiles = _mixed_profiles(['twitter'] * 10)
+        results = stub_qpi(session).submit_mixed_profiles(
+            profiles, default_limits=SiteLimits(interval=0))
+        next(results)
+        results.close()
+        time.sleep(0.3)
+
+        self.assertLessEqual(len(session.calls), 2)
+
+
+class SiteLimitsTest(unittest.TestCase):
+    """
+    Test validation of per-site limits.
+    """
+
+    def test_invalid_limits(self):
+        """
+        Test that limits which would drop work are rejected.
+        """
+        for kwargs in ({'chunk_size': 0}, {'chunk_size': -1},
+                       {'concurrency': 0}, {'interval': -1}):
+            with self.assertRaises(ValueError):
+                SiteLimits(**kwargs)
+
+    def test_parse_site_limits(self):
+        """
+        Test parsing SITE:CHUNK:INTERVAL:CONCURRENCY options.
+        """
+        limits = _parse_site_limits(None, None, ('twitter:10:0.5:2',))
+
+        self.assertEqual(list(limits), ['twitter'])
+        self.assertEqual((limits['twitter'].chunk_size,
+                          limits['twitter'].interval,
+                          limits['twitter'].concurrency), (10, 0.5, 2))
+
+        for option in ('twitter:0:1:1', 'twitter:1:-1:1', 'twitter:1:1:0',
+                       'myspace:1:1:1', 'twitter:1:1'):
+            with self.assertRaises(click.BadParameter):
+                _parse_site_limits(None, None, (option,))
+
+
+class MixedReportTest(unittest.TestCase):
+    """
+    Test reporting mixed-site results.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_csv_indexes(self):
+        """
+        Test that input indexes are written to CSV reports.
+        """
+        path = os.path.join(self.directory, 'report.csv')
+        profiles = _mixed_profiles(['twitter', 'instagram', 'twitter'])
+        results = stub_qpi().submit_mixed_profiles(
+            profiles, default_limits=SiteLimits(chunk_size=2, interval=0))
+
+        with _SubmissionReport(path, format_='csv') as report:
+            for result in results:
+                report.write(result)
+
+        with open(path, newline='') as report_file:
+            rows = {row['site']: row for row in csv.DictReader(report_file)}
+
+        self.assertEqual(rows['twitter']['indexes'], '0|2')
+        self.assertEqual(rows['instagram']['indexes'], '1')
+        self.assertEqual(report.profiles, 3)
+
+
+class SubmitMixedCommandTest(unittest.TestCase):
+    """
+    Test the submit_mixed command.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, 'feed.csv')
+        self.report = os.path.join(self.directory, 'report.ndjson')
+        self.config = Config()
+        self.config.app_url = 'http://quickpin.invalid'
+        self.config.token = 'token'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def invoke(self, feed, *args):
+        with open(self.input, 'w') as input_file:
+            input_file.write(feed)
+
+        session = StubSession()
+
+        with mock.patch('quickpin_api.qpi.requests.Session',
+                        return_value=session):
+            result = CliRunner().invoke(submit_mixed,
+                                        [self.input,
+                                         '--interval', '0',
+                                         '--report', self.report] +
+                                        list(args),
+                                        obj=self.config)
+
+        return result, session
+
+    def test_rows(self):
+        """
+        Test that unknown-site and blank rows keep report rows aligned.
+        """
+        result, session = self.invoke('twitter,alice\nmyspace,bob\n'
+                                      'Instagram,carol,osint\n,\n'
+                                      'twitter,dave\n')
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Skipped 1 rows with unknown sites', result.output)
+
+        with open(self.report) as report_file:
+            rows = [json.loads(line) for line in report_file]
+
+        by_row = {}
+        for row in rows:
+            for row_number in row['rows']:
+                by_row[row_number] = row['site']
+
+        self.assertEqual(by_row, {0: 'twitter', 2: 'instagram',
+                                  4: 'twitter'})
+
+        usernames = {p['username']: p for _, _, request in session.calls
+                     for p in request}
+        self.assertEqual(sorted(usernames), ['alice', 'carol', 'dave'])
+        self.assertEqual(usernames['carol']['labels'], ['osint'])
+
+    def test_by_id(self):
+        """
+        Test that --by=id submits upstream IDs.
+        """
+        result, session = self.invoke('twitter,123\n', '--by', 'id')
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(session.calls[0][2][0]['upstream_id'], '123')
+
+    def test_invalid_limits(self):
+        """
+        Test that invalid limits are rejected before anything is sent.
+        """
+        result, session = self.invoke('twitter,alice\n',
+                                      '--site-limit', 'twitter:0:1:1')
+
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(session.calls, [])
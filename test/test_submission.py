@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Submission result and report tests.
+"""
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from click.testing import CliRunner
+
+from .stubs import StubResponse, StubSession, stub_qpi
+from quickpin_api.qpi import (Config, QPIError, SubmissionResult,
+                              _SubmissionReport, submit_ids, submit_names)
+
+
+def _profiles(count, site='twitter'):
+    return [{'username': 'user{}'.format(i), 'site': site, 'labels': []}
+            for i in range(count)]
+
+
+class SubmissionResultTest(unittest.TestCase):
+    """
+    Test parsing API responses into results.
+    """
+
+    def test_from_response(self):
+        """
+        Test that status, IDs and message are parsed.
+        """
+        response = StubResponse(202, {'message': '2 submitted',
+                                      'ids': [7, 8]})
+        result = SubmissionResult.from_response(4, 6, response, 0.5,
+                                                site='twitter')
+
+        self.assertTrue(result.ok)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result.to_dict(), {
+            'site': 'twitter', 'start': 4, 'end': 6, 'indexes': None,
+            'rows': None, 'status': 202,
+            'latency': 0.5, 'ids': [7, 8], 'message': '2 submitted',
+            'error': None,
+        })
+
+    def test_from_response_single_id(self):
+        """
+        Test that a scalar `id` becomes a list.
+        """
+        response = StubResponse(200, {'id': 3})
+        result = SubmissionResult.from_response(0, 1, response, 0.1)
+
+        self.assertEqual(result.ids, [3])
+
+    def test_from_response_failure(self):
+        """
+        Test that a rejected response without JSON is a failed result.
+        """
+        response = StubResponse(500, reason='Server Error')
+        result = SubmissionResult.from_response(0, 1, response, 0.1,
+                                                ok=False)
+
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, 'Server Error')
+        self.assertEqual(result.ids, [])
+
+
+class SubmitProfilesTest(unittest.TestCase):
+    """
+    Test chunked profile submission.
+    """
+
+    def test_chunks(self):
+        """
+        Test that each chunk yields a result with its input range.
+        """
+        session = StubSession()
+        results = list(stub_qpi(session).submit_profiles(_profiles(5),
+                                                         chunk_size=2,
+                                                         interval=0))
+
+        self.assertEqual([(r.start, r.end) for r in results],
+                         [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual([r.ids for r in results], [[0, 1], [2, 3], [4]])
+        self.assertEqual(len(session.calls), 3)
+
+    def test_connection_error_reported(self):
+        """
+        Test that connection errors become failed results.
+        """
+        def handler(profiles):
+            if profiles[0]['username'] == 'user2':
+                raise requests.ConnectionError('refused')
+            return StubResponse(202, {})
+
+        qpi = stub_qpi(StubSession(handler))
+        results = list(qpi.submit_profiles(_profiles(4), chunk_size=2,
+                                           interval=0,
+                                           raise_on_error=False))
+
+        self.assertEqual([r.ok for r in results], [True, False])
+        self.assertEqual((results[1].start, results[1].end), (2, 4))
+        self.assertIsNone(results[1].status)
+        self.assertEqual(results[1].error, 'refused')
+
+    def test_connection_error_raised(self):
+        """
+        Test that connection errors are raised by default.
+        """
+        def handler(profiles):
+            raise requests.ConnectionError('refused')
+
+        qpi = stub_qpi(StubSession(handler))
+
+        with self.assertRaises(requests.ConnectionError):
+            list(qpi.submit_profiles(_profiles(1)))
+
+    def test_unexpected_success_status_raised(self):
+        """
+        Test that a 2xx status outside the allowed codes raises.
+        """
+        qpi = stub_qpi(StubSession(lambda profiles: StubResponse(201, {})))
+
+        with self.assertRaises(QPIError):
+            list(qpi.submit_profiles(_profiles(1)))
+
+
+class SubmissionReportTest(unittest.TestCase):
+    """
+    Test streaming results to report files.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.results = [
+            SubmissionResult(0, 2, 202, 0.25, ids=[1, 2], message='ok',
+                             site='twitter'),
+            SubmissionResult(2, 3, 400, 0.75, message='bad', error='bad',
+                             site='twitter'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, format_):
+        path = os.path.join(self.directory, 'report.' + format_)
+
+        with _SubmissionReport(path, format_=format_) as report:
+            for result in self.results:
+                report.write(result)
+
+        return path, report
+
+    def test_ndjson(self):
+        """
+        Test that each result is written as one JSON line.
+        """
+        path, _ = self._write('ndjson')
+
+        with open(path) as report_file:
+            rows = [json.loads(line) for line in report_file]
+
+        self.assertEqual(rows, [r.to_dict() for r in self.results])
+
+    def test_csv(self):
+        """
+        Test that results are written as CSV rows with pipe separated IDs.
+        """
+        path, _ = self._write('csv')
+
+        with open(path, newline='') as report_file:
+            rows = list(csv.DictReader(report_file))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['ids'], '1|2')
+        self.assertEqual(rows[0]['rows'], '')
+        self.assertEqual(rows[0]['start'], '0')
+        self.assertEqual(rows[1]['status'], '400')
+        self.assertEqual(rows[1]['error'], 'bad')
+
+    def test_summary(self):
+        """
+        Test that the summary tallies profiles, failures and IDs.
+        """
+        _, report = self._write('ndjson')
+
+        self.assertEqual(report.profiles, 3)
+        self.assertEqual(report.failed_chunks, 1)
+        self.assertEqual(report.failed_profiles, 1)
+        self.assertEqual(report.ids, 2)
+        self.assertIn('Submitted 3 profiles in 2 chunks', report.summary())
+
+
+class SubmitCommandTest(unittest.TestCase):
+    """
+    Test the submit_names and submit_ids commands.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, 'input.csv')
+        self.report = os.path.join(self.directory, 'report.ndjson')
+        self.config = Config()
+        self.config.app_url = 'http://quickpin.invalid'
+        self.config.token = 'token'
+
+        with open(self.input, 'w') as input_file:
+            input_file.write('alice,osint\n\n,\nbob\ncarol\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def invoke(self, command, session):
+        with mock.patch('quickpin_api.qpi.requests.Session',
+                        return_value=session):
+            result = CliRunner().invoke(command,
+                                        [self.input, 'twitter',
+                                         '--chunk', '2',
+                                         '--interval', '0',
+                                         '--report', self.report],
+                                        obj=self.config)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        with open(self.report) as report_file:
+            return [json.loads(line) for line in report_file], result
+
+    def test_submit_names_rows(self):
+        """
+        Test that report rows point at input rows despite blank lines.
+        """
+        session = StubSession()
+        rows, result = self.invoke(submit_names, session)
+
+        self.assertEqual([row['rows'] for row in rows], [[0, 3], [4]])
+        self.assertEqual([p['username'] for p in session.calls[0][2]],
+                         ['alice', 'bob'])
+        self.assertEqual(session.calls[0][2][0]['labels'], ['osint'])
+        self.assertIn('Submitted 3 profiles in 2 chunks', result.output)
+
+    def test_submit_ids_rows(self):
+        """
+        Test that ID submissions report their input rows.
+        """
+        session = StubSession()
+        rows, _ = self.invoke(submit_ids, session)
+
+        self.assertEqual([row['rows'] for row in rows], [[0, 3], [4]])
+        self.assertEqual(session.calls[1][2][0]['upstream_id'], 'carol')